@@ -1,24 +1,55 @@
 import os
-import pandas as pd
+import html
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 from dotenv import load_dotenv
 
-from backend import (
-    get_llm,
-    research_product,
-    search_prices_serper,
-    summarize_prices_for_prompt,
-    make_price_rows,
-    build_final_report,
-)
+# backend (and through it langchain_groq) is imported lazily in the run
+# block so cold Streamlit startup doesn't pay for it.
 
 load_dotenv()
 
 st.set_page_config(page_title="Shopping Assistant (INR)", page_icon="🛍️", layout="wide")
 
+# ---- Caching (survives Streamlit reruns from widget changes) ----
+@st.cache_resource
+def _get_llm_cached():
+    from backend import get_llm
+    return get_llm()
+
+
+# Serper is paid and rate-limited: a 30 min TTL means demo clicks and
+# widget tweaks within a session skip the network entirely.
+@st.cache_data(ttl=1800, show_spinner=False, max_entries=512)
+def _cached_prices(queries: tuple) -> dict:
+    from backend import search_prices_serper
+    prices = search_prices_serper(queries)
+    if prices.get("error"):
+        # st.cache_data doesn't cache exceptions — raise so a transient
+        # Serper failure isn't pinned for the TTL
+        raise RuntimeError(f"Serper error: {prices['error']}")
+    return prices
+
+def _rows_to_html_table(rows: list) -> str:
+    # Tiny N: a plain HTML table skips DataFrame construction, Arrow
+    # serialization, and the client-side React grid entirely.
+    body = "".join(
+        "<tr>"
+        f'<td><a href="{html.escape(r["Link"], quote=True)}" target="_blank">{html.escape(r["Title"])}</a></td>'
+        f'<td>{html.escape(r["Price (Original)"])}</td>'
+        f'<td>{html.escape(r["Price (INR)"])}</td>'
+        "</tr>"
+        for r in rows
+    )
+    return (
+        '<table class="card" width="100%">'
+        "<thead><tr><th>Title</th><th>Price (Original)</th><th>Price (INR)</th></tr></thead>"
+        f"<tbody>{body}</tbody></table>"
+    )
+
 # ---- Aesthetic Header ----
-st.markdown(
-    """
+_CSS = """
     <style>
     .big-title {font-size: 34px; font-weight: 700; margin-bottom: 4px;}
     .subtle {color: #6b7280;}
@@ -26,9 +57,9 @@ st.markdown(
     .pill {display:inline-block; padding:4px 10px; border-radius:999px; border:1px solid #e5e7eb; font-size:12px; color:#374151; background:#fff;}
     a {text-decoration: none;}
     </style>
-    """,
-    unsafe_allow_html=True
-)
+    """
+
+st.markdown(_CSS, unsafe_allow_html=True)
 
 st.markdown('<div class="big-title">🛍️ Shopping Assistant</div>', unsafe_allow_html=True)
 st.markdown('<div class="subtle">Research products, compare prices, and get a clean recommendation for Indian buyers.</div>', unsafe_allow_html=True)
@@ -52,35 +83,66 @@ run = st.button("🔎 Run Search", use_container_width=True)
 # ---- Results ----
 if run:
     try:
-        llm = get_llm()
-
-        with st.spinner("Researching product details..."):
-            research = research_product(llm, query)
-
-        with st.spinner("Fetching prices..."):
-            prices_json = search_prices_serper(f"{query} best price")
-
-        # Build table rows
+        from backend import (
+            research_product_stream,
+            summarize_prices_for_prompt,
+            make_price_rows,
+            make_price_rows_columnar,
+            build_final_report_stream,
+            price_query_variants,
+        )
+
+        llm = _get_llm_cached()
+
+        # Kick off the price fetch in the background while research streams
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            prices_future = pool.submit(_cached_prices, tuple(price_query_variants(query)))
+
+            # Research depends only on the query, not on top_n/usd_inr —
+            # reuse it within the session so widget tweaks only re-run
+            # the table shaping and the final report.
+            research_cache = st.session_state.setdefault("research_cache", {})
+
+            st.markdown("## 🔍 Research")
+            if query in research_cache:
+                research = research_cache.pop(query)  # re-insert below for LRU order
+                st.markdown(research)
+            else:
+                research = st.write_stream(research_product_stream(llm, query))
+            research_cache[query] = research
+            while len(research_cache) > 32:
+                research_cache.pop(next(iter(research_cache)))
+
+            try:
+                prices_json = prices_future.result()
+            except Exception as e:
+                # Prices are optional: warn and carry on so the research
+                # and final report still render.
+                st.warning(f"Price lookup failed: {e}")
+                prices_json = {"shopping": []}
+
+        # Build price table rows (plain Python for the tiny N shown here)
         rows = make_price_rows(prices_json, top_n=int(top_n), usd_inr=float(usd_inr))
-        df = pd.DataFrame(rows)
 
         # Summarize for LLM
         price_summary_text = summarize_prices_for_prompt(prices_json, top_n=int(top_n), usd_inr=float(usd_inr))
 
-        with st.spinner("Generating final report..."):
-            report = build_final_report(llm, research, price_summary_text)
-
-        st.markdown("## 🔍 Research")
-        st.markdown(f'<div class="card">{research}</div>', unsafe_allow_html=True)
-
         st.markdown("## 💸 Price Comparison (converted to INR)")
-        if not df.empty:
-            st.dataframe(df, use_container_width=True, hide_index=True)
-        else:
+        if not rows:
             st.info("No shopping results found.")
+        elif len(rows) > 50:
+            # Large batches: typed Arrow table straight into the
+            # virtualized grid — Streamlit skips its own pandas-to-Arrow
+            # conversion when handed Arrow directly.
+            import pyarrow as pa
+            cols = make_price_rows_columnar(prices_json, top_n=int(top_n), usd_inr=float(usd_inr))
+            schema = pa.schema([(name, pa.string()) for name in cols])
+            st.dataframe(pa.table(cols, schema=schema), use_container_width=True, hide_index=True)
+        else:
+            st.markdown(_rows_to_html_table(rows), unsafe_allow_html=True)
 
         st.markdown("## ✅ Final Recommendation")
-        st.markdown(f'<div class="card">{report}</div>', unsafe_allow_html=True)
+        report = st.write_stream(build_final_report_stream(llm, research, price_summary_text))
 
     except Exception as e:
         st.error(f"Something went wrong: {e}")
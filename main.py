@@ -1,10 +1,10 @@
 from backend import (
     get_llm,
-    research_product,
     search_prices_serper,
     summarize_prices_for_prompt,
-    build_final_report,
+    research_and_report,
     make_price_rows,
+    price_query_variants,
 )
 
 def main():
@@ -14,24 +14,21 @@ def main():
 
     llm = get_llm()
     print("\n==============================")
-    print(" STEP 1: Product Research")
+    print(" STEP 1: Price Comparison")
     print("==============================")
-    research = research_product(llm, query)
-    print(research)
-
-    print("\n==============================")
-    print(" STEP 2: Price Comparison")
-    print("==============================")
-    prices = search_prices_serper(f"{query} best price")
+    prices = search_prices_serper(price_query_variants(query))
     rows = make_price_rows(prices, top_n=top_n, usd_inr=usd_inr)
-    for r in rows:
-        print(f"- {r['Title']} | {r['Price (INR)']} (orig: {r['Price (Original)']}) | {r['Link']}")
+    print("\n".join(
+        f"- {r['Title']} | {r['Price (INR)']} (orig: {r['Price (Original)']}) | {r['Link']}"
+        for r in rows
+    ))
 
     print("\n==============================")
-    print(" STEP 3: Final Report")
+    print(" STEP 2: Research + Final Report (single LLM call)")
     print("==============================")
     price_summary = summarize_prices_for_prompt(prices, top_n=top_n, usd_inr=usd_inr)
-    report = build_final_report(llm, research, price_summary)
+    research, report = research_and_report(llm, query, price_summary)
+    print(research)
     print(report)
 
 if __name__ == "__main__":